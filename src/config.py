@@ -6,6 +6,8 @@ Author: wdblink
 """
 
 import os
+import importlib.util
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from dotenv import load_dotenv
@@ -13,6 +15,9 @@ from dotenv import load_dotenv
 # 加载 .env 文件
 load_dotenv()
 
+# 支持的文件变更检测哈希算法；xxh3_64 需要额外安装 xxhash
+SUPPORTED_HASH_ALGOS = ("md5", "blake2b", "xxh3_64")
+
 class Config:
     """
     应用程序配置类。
@@ -22,6 +27,8 @@ class Config:
         NOTION_DATABASE_ID (str): Notion Database ID.
         OBSIDIAN_VAULT_PATH (Path): 本地 Obsidian 仓库路径.
         SYNC_INTERVAL_MINUTES (int): 同步间隔时间（分钟）.
+        SYNC_MAX_WORKERS (int): 并发同步文件的线程数.
+        HASH_ALGO (str): 检测文件变更使用的哈希算法.
         LOG_LEVEL (str): 日志级别.
     """
 
@@ -34,6 +41,10 @@ class Config:
         self.OBSIDIAN_VAULT_PATH: Path = Path(vault_path)
         
         self.SYNC_INTERVAL_MINUTES: int = int(os.getenv("SYNC_INTERVAL_MINUTES", "60"))
+        # Notion API 平均限速约为每秒 3 个请求，默认并发数与之对应
+        self.SYNC_MAX_WORKERS: int = int(os.getenv("SYNC_MAX_WORKERS", "3"))
+        # 哈希只用于变更检测，不需要抗碰撞性，默认使用比 MD5 更快的 BLAKE2
+        self.HASH_ALGO: str = os.getenv("HASH_ALGO", "blake2b").lower()
         self.LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
         
         self._validate()
@@ -61,30 +72,28 @@ class Config:
         验证配置的有效性。
         
         Raises:
-            ValueError: 如果路径不存在或无效.
+            ValueError: 如果路径不存在或无效，并发数小于 1，或哈希算法不可用.
         """
+        if self.SYNC_MAX_WORKERS < 1:
+            raise ValueError(f"SYNC_MAX_WORKERS must be at least 1: {self.SYNC_MAX_WORKERS}")
+        if self.HASH_ALGO not in SUPPORTED_HASH_ALGOS:
+            raise ValueError(f"Unsupported HASH_ALGO: {self.HASH_ALGO} (choose from {', '.join(SUPPORTED_HASH_ALGOS)})")
+        if self.HASH_ALGO == "xxh3_64" and importlib.util.find_spec("xxhash") is None:
+            raise ValueError("HASH_ALGO=xxh3_64 requires the xxhash package (pip install xxhash)")
         if not self.OBSIDIAN_VAULT_PATH.exists():
              # 在测试或首次运行时，路径可能暂时不存在，可以只打印警告或者抛出异常
              # 为了健壮性，这里先抛出异常，确保用户配置正确
              raise ValueError(f"Obsidian vault path does not exist: {self.OBSIDIAN_VAULT_PATH}")
 
-# 全局配置实例
-try:
-    # 只有在环境变量存在时才能安全初始化，否则可能在导入时报错
-    # 这里我们允许延迟初始化，或者假设用户已经配好了环境
-    # 为了方便测试，如果环境变量缺失，可能需要在 main 中处理异常
-    config = Config()
-except ValueError:
-    config = None  # type: ignore
-
+@lru_cache(maxsize=1)
 def get_config() -> Config:
     """
-    获取配置单例。如果初始化失败（例如缺少环境变量），则再次尝试初始化以抛出详细错误。
+    获取配置单例。
+    
+    首次成功创建后缓存复用；初始化失败（例如缺少环境变量）时不会缓存，
+    下次调用会再次尝试初始化并抛出详细错误。
     
     Returns:
         Config: 配置对象.
     """
-    global config
-    if config is None:
-        config = Config()
-    return config
+    return Config()
@@ -14,20 +14,41 @@ from src.utils import setup_logger
 
 logger = setup_logger(__name__)
 
-def job():
-    """定时任务函数。"""
+# 监听模式下处理变更队列的间隔秒数，期间的多次保存合并为一次同步
+WATCH_POLL_SECONDS = 2
+
+def job(service: SyncService):
+    """
+    定时任务函数。
+    
+    Args:
+        service: 同步服务，在多次任务之间复用其 Notion 连接和线程池。
+    """
     logger.info("Scheduled sync job started.")
     try:
-        service = SyncService()
         service.sync()
     except Exception as e:
         logger.error(f"Job failed: {e}")
     logger.info("Scheduled sync job finished.")
 
+def watch_job(service: SyncService):
+    """
+    监听模式下的任务函数，同步收到变更事件的文件。
+    
+    Args:
+        service: 同步服务。
+    """
+    try:
+        service.sync_pending()
+    except Exception as e:
+        logger.error(f"Watch job failed: {e}")
+
 def main():
     """主函数。"""
     parser = argparse.ArgumentParser(description="Obsidian to Notion Sync Service")
     parser.add_argument("--once", action="store_true", help="Run sync once and exit")
+    parser.add_argument("--watch", action="store_true",
+                        help="Sync changed files as soon as they are saved (requires watchdog)")
     args = parser.parse_args()
 
     try:
@@ -36,33 +57,51 @@ def main():
         logger.critical(f"Configuration error: {e}")
         return
 
-    # 初始化一次服务以确保连接正常
+    # 初始化一次服务，之后的每次同步都复用它
     try:
-        # 可以在这里做一些连通性测试
-        pass
+        service = SyncService()
     except Exception as e:
         logger.critical(f"Initialization failed: {e}")
         return
 
-    if args.once:
-        logger.info("Running one-time sync...")
-        job()
-        return
+    try:
+        if args.once:
+            logger.info("Running one-time sync...")
+            job(service)
+            return
 
-    interval = config.SYNC_INTERVAL_MINUTES
-    logger.info(f"Starting scheduler. Sync interval: {interval} minutes.")
-    
-    # 立即运行一次
-    job()
-    
-    schedule.every(interval).minutes.do(job)
+        interval = config.SYNC_INTERVAL_MINUTES
+        logger.info(f"Starting scheduler. Sync interval: {interval} minutes.")
 
-    try:
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-    except KeyboardInterrupt:
-        logger.info("Service stopped by user.")
+        # 监听模式下只同步发生变化的文件；定时全量同步仍然保留，
+        # 用于补上监听启动前以及事件队列溢出时遗漏的变化
+        observer = None
+        if args.watch:
+            try:
+                observer = service.watch()
+            except RuntimeError as e:
+                logger.critical(str(e))
+                return
+            logger.info("Watching vault for changes.")
+            schedule.every(WATCH_POLL_SECONDS).seconds.do(watch_job, service)
+        
+        # 立即运行一次
+        job(service)
+        
+        schedule.every(interval).minutes.do(job, service)
+
+        try:
+            while True:
+                schedule.run_pending()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            logger.info("Service stopped by user.")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+    finally:
+        service.close()
 
 if __name__ == "__main__":
     main()
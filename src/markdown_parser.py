@@ -6,87 +6,159 @@ Markdown Parser module.
 Author: wdblink
 """
 
+import io
 import re
+import threading
 import yaml
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, Iterable, Iterator, List, Tuple, Any, Optional
 from datetime import datetime
 from .utils import setup_logger
 
+try:
+    # 优先使用 libyaml 提供的 C 实现，不可用时退回纯 Python 实现
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
 logger = setup_logger(__name__)
 
+# 按行缓存的 Block 数量上限，超出后淘汰最早加入的条目
+BLOCK_CACHE_SIZE = 4096
+# 超过该长度的行不缓存：模板行通常很短，而粘贴的 base64 等超长行作为缓存键会长期占用内存
+BLOCK_CACHE_MAX_LINE_LENGTH = 2000
+
 class MarkdownParser:
     """
     Markdown 解析器类。
     """
 
+    # 行类型识别：一次匹配即可判断一行属于哪种 Block，由 match.lastgroup 给出类型
+    # 除标题必须顶格外，其余类型允许行首缩进；(?=.*\S) 保证去掉首尾空白后仍有内容
+    _BLOCK_RE = re.compile(
+        r'(?P<blank>\s*$)'
+        r'|(?P<fence>\s*```(?P<lang>.*))'
+        r'|(?P<heading>(?P<hashes>#{1,3}) (?P<heading_text>.*))'
+        r'|(?P<list>\s*[-*] (?=.*\S)(?:\[(?P<mark>[ x])\] (?=.*\S))?(?P<item>.*))'
+        r'|(?P<numbered>\s*\d+\.\s(?=.*\S)(?P<numbered_text>.*))'
+        r'|(?P<quote>\s*> (?=.*\S)(?P<quote_text>.*))'
+    )
+    # 行内替换：Obsidian 图片 ![[image.png]] 或 WikiLink [[Page Name]] / [[Page Name|Alias]]
+    # 合并为一个模式，一次扫描完成全部替换；
+    # 链接名中不允许出现 [，否则孤立的 [[ 会吞掉其后的图片嵌入
+    _INLINE_RE = re.compile(
+        r'!\[\[(?P<img>[^\]]*)\]\]'
+        r'|\[\[(?P<page>[^\[\]|]*)(?:\|(?P<alias>[^\[\]]*))?\]\]'
+    )
+
     def __init__(self):
-        # 匹配 Frontmatter
-        self.frontmatter_pattern = re.compile(r'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
         # 匹配图片 ![[image.png]] 或 ![alt](url)
         self.obsidian_image_pattern = re.compile(r'!\[\[(.*?)\]\]')
         self.md_image_pattern = re.compile(r'!\[(.*?)\]\((.*?)\)')
-        # 匹配 WikiLink [[Page Name]] 或 [[Page Name|Alias]]
-        self.wikilink_pattern = re.compile(r'\[\[(.*?)(?:\|(.*?))?\]\]')
         # 匹配标签 #tag
         self.tag_pattern = re.compile(r'(?<=[\s^])#([\w\-/]+)')
+        # 代码块之外，一行生成的 Block 只取决于该行内容，模板等重复出现的行可直接复用
+        self._block_cache: Dict[str, Dict[str, Any]] = {}
+        self._block_cache_lock = threading.Lock()
 
-    def parse_file(self, file_path: Path) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    def parse_file(self, file_path: Path, mtime: Optional[float] = None,
+                   content: Optional[str] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
         """
         解析 Markdown 文件。
         
         Args:
             file_path: 文件路径。
+            mtime: 文件修改时间，调用方已获取时传入以免重复 stat。
+            content: 文件内容，调用方已读取时传入以免再次读盘。
             
         Returns:
             (properties, blocks) 元组。
             properties: 提取的 Notion 页面属性（如 Tags, Name）。
             blocks: Notion 内容块列表。
         """
+        # 按行流式读取：先读到 Frontmatter 结束，再把剩余行直接交给正文解析器
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-        except Exception as e:
+            # newline=None 与文本模式 open 一样统一换行符
+            source = open(file_path, 'r', encoding='utf-8') if content is None else io.StringIO(content, newline=None)
+            with source as f:
+                # 1. 提取 Frontmatter
+                frontmatter, body_lines = self._split_frontmatter(f)
+                # 2. 解析 Body 为 Blocks
+                blocks = self._parse_body_lines(self._strip_newlines(body_lines))
+        except (OSError, ValueError) as e:
             logger.error(f"Failed to read file {file_path}: {e}")
             return {}, []
 
-        # 1. 提取 Frontmatter 和 Body
-        frontmatter, body = self._extract_frontmatter(content)
-        
-        # 2. 生成 Properties
+        # 3. 生成 Properties
         # 默认使用文件名作为标题
         title = file_path.stem
-        properties = self._build_properties(title, frontmatter, file_path)
-        
-        # 3. 解析 Body 为 Blocks
-        blocks = self._parse_body_to_blocks(body)
+        properties = self._build_properties(title, frontmatter, file_path, mtime)
         
         return properties, blocks
 
     def _extract_frontmatter(self, content: str) -> Tuple[Dict, str]:
-        """提取 YAML Frontmatter。"""
-        match = self.frontmatter_pattern.match(content)
-        if match:
-            yaml_content = match.group(1)
-            try:
-                frontmatter = yaml.safe_load(yaml_content)
-                # 如果 yaml_content 为空或解析失败，yaml.safe_load 可能返回 None
-                if frontmatter is None:
+        """提取 YAML Frontmatter，返回 (frontmatter, body)。"""
+        frontmatter, body_lines = self._split_frontmatter(io.StringIO(content))
+        return frontmatter, ''.join(body_lines)
+
+    def _split_frontmatter(self, lines: Iterator[str]) -> Tuple[Dict, Iterable[str]]:
+        """
+        从行迭代器中提取 YAML Frontmatter。
+        
+        只消费 Frontmatter 所在的行，正文部分仍以迭代器形式返回，不会整体读入内存。
+        
+        Args:
+            lines: 带换行符的行迭代器（如文件对象）。
+            
+        Returns:
+            (frontmatter, body_lines) 元组。
+        """
+        first = next(lines, None)
+        if first is None:
+            return {}, ()
+        # Frontmatter 必须以首行的 --- 开始
+        if first.rstrip() != '---' or not first.endswith('\n'):
+            return {}, chain((first,), lines)
+
+        head = [first]
+        for line in lines:
+            head.append(line)
+            # 与 Frontmatter 起始行之间至少要有一行
+            if len(head) > 2 and line.rstrip() == '---' and line.endswith('\n'):
+                yaml_content = ''.join(head[1:-1])
+                try:
+                    frontmatter = yaml.load(yaml_content, Loader=_YamlLoader)
+                except yaml.YAMLError as e:
+                    logger.warning(f"Failed to parse YAML frontmatter: {e}")
+                    return {}, chain(head, lines)
+                # yaml_content 为空时解析结果为 None；非映射类型同样视为没有元数据
+                if not isinstance(frontmatter, dict):
                     frontmatter = {}
-                return frontmatter, content[match.end():]
-            except yaml.YAMLError as e:
-                logger.warning(f"Failed to parse YAML frontmatter: {e}")
-                return {}, content
-        return {}, content
+                return frontmatter, lines
 
-    def _build_properties(self, title: str, frontmatter: Dict, file_path: Path) -> Dict[str, Any]:
+        # 没有找到结束的 ---，整个文件都是正文
+        return {}, head
+
+    @staticmethod
+    def _strip_newlines(lines: Iterable[str]) -> Iterator[str]:
+        """去掉行尾换行符，结果与对整段文本调用 split('\\n') 一致。"""
+        line = '\n'
+        for line in lines:
+            yield line[:-1] if line.endswith('\n') else line
+        # 文本以换行结尾时 split 会多出一个空字符串
+        if line.endswith('\n'):
+            yield ''
+
+    def _build_properties(self, title: str, frontmatter: Dict, file_path: Path,
+                          mtime: Optional[float] = None) -> Dict[str, Any]:
         """
         构建 Notion Properties。
         
         映射规则:
         - title -> Name (Title)
         - tags -> Tags (Multi-select)
-        - date/created -> Date (Date)
+        - date/created -> Date (Date)，缺省时使用文件修改时间
         """
         properties = {
             "Name": {
@@ -111,18 +183,17 @@ class MarkdownParser:
 
         # 处理 Date (优先使用 date, 其次 created, 最后用文件修改时间)
         date_val = frontmatter.get('date') or frontmatter.get('created')
-        if not date_val:
-             # 使用文件修改时间
-             mtime = file_path.stat().st_mtime
-             date_val = datetime.fromtimestamp(mtime).isoformat()
-        
         if date_val:
-            # 确保是 ISO 格式字符串
-            if isinstance(date_val, (datetime,  object)): # date object
-                date_val = str(date_val)
-            properties["Date"] = {
-                "date": {"start": date_val}
-            }
+            # YAML 可能解析出 date/datetime 对象，统一转为字符串
+            date_val = str(date_val)
+        else:
+            # 使用文件修改时间
+            if mtime is None:
+                mtime = file_path.stat().st_mtime
+            date_val = datetime.fromtimestamp(mtime).isoformat()
+        properties["Date"] = {
+            "date": {"start": date_val}
+        }
 
         return properties
 
@@ -131,78 +202,90 @@ class MarkdownParser:
         将 Markdown 正文转换为 Notion Blocks。
         这是一个简化的按行解析器。
         """
+        return self._parse_body_lines(body.split('\n'))
+
+    def _parse_body_lines(self, lines: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        将正文行序列转换为 Notion Blocks。
+        
+        代码块之外的行按内容缓存生成的 Block，返回的 Block 可能被多个页面共享，调用方不应修改。
+        
+        Args:
+            lines: 不含换行符的正文行，可以是迭代器。
+        """
         blocks = []
-        lines = body.split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            # 跳过空行，但如果需要在 Notion 里面保留空行，可以加一个空的 paragraph
-            # 为了美观，Notion block 之间自带间距，通常不需要空 block，除非是显式的空行意图
-            if not line.strip():
-                # 可以在这里决定是否添加空段落
-                # blocks.append(self._create_paragraph_block("")) 
-                i += 1
+        append = blocks.append
+        create_paragraph = self._create_paragraph_block
+        match_block = self._BLOCK_RE.match
+        cached_block = self._block_cache.get
+        # 处于代码块内时为已收集的代码行，否则为 None
+        code_lines = None
+        language = ""
+
+        for line in lines:
+            if code_lines is not None:
+                # 消费到结束的 ``` 为止（只需去掉行首空白即可判断）
+                if line.lstrip().startswith('```'):
+                    append(self._create_code_block('\n'.join(code_lines), language))
+                    code_lines = None
+                else:
+                    code_lines.append(line)
                 continue
-            
-            # 识别 Code Block
-            if line.strip().startswith('```'):
-                code_content = []
-                language = line.strip()[3:].strip()
-                i += 1
-                while i < len(lines) and not lines[i].strip().startswith('```'):
-                    code_content.append(lines[i])
-                    i += 1
-                # 消费掉结束的 ```
-                if i < len(lines):
-                    i += 1
-                blocks.append(self._create_code_block('\n'.join(code_content), language))
+
+            block = cached_block(line)
+            if block is not None:
+                append(block)
                 continue
 
-            # 识别 Heading
-            if line.startswith('# '):
-                blocks.append(self._create_heading_block(line[2:], 1))
-            elif line.startswith('## '):
-                blocks.append(self._create_heading_block(line[3:], 2))
-            elif line.startswith('### '):
-                blocks.append(self._create_heading_block(line[4:], 3))
-            
-            # 识别 List Item
-            elif line.strip().startswith('- ') or line.strip().startswith('* '):
-                content = line.strip()[2:]
-                # 检查是否是 Todo
-                if content.startswith('[ ] '):
-                    blocks.append(self._create_todo_block(content[4:], False))
-                elif content.startswith('[x] '):
-                    blocks.append(self._create_todo_block(content[4:], True))
-                else:
-                    blocks.append(self._create_bulleted_list_item(content))
-            
-            # 识别 Numbered List
-            elif re.match(r'^\d+\.\s', line.strip()):
-                content = re.sub(r'^\d+\.\s', '', line.strip())
-                blocks.append(self._create_numbered_list_item(content))
-            
-            # 识别 Quote
-            elif line.strip().startswith('> '):
-                blocks.append(self._create_quote_block(line.strip()[2:]))
-            
-            # 识别 Image (行内图片作为独立 Block 处理)
-            # 简化处理：如果一行主要是图片，则作为 Image Block，否则作为 Text
-            elif self._is_image_line(line):
-                image_block = self._create_image_block(line)
-                if image_block:
-                    blocks.append(image_block)
-                else:
-                    blocks.append(self._create_paragraph_block(line))
-            
-            # 默认 Paragraph
+            match = match_block(line)
+            if match is None:
+                # 识别 Image (行内图片作为独立 Block 处理)
+                # 简化处理：如果一行主要是图片，则作为 Image Block，否则作为 Text
+                image_block = self._create_image_block(line) if self._is_image_line(line) else None
+                block = image_block if image_block else create_paragraph(line)
             else:
-                blocks.append(self._create_paragraph_block(line))
-            
-            i += 1
+                kind = match.lastgroup
+                # 跳过空行，Notion block 之间自带间距，通常不需要空 block
+                if kind == 'blank':
+                    continue
+                if kind == 'fence':
+                    language = match.group('lang').strip()
+                    code_lines = []
+                    continue
+                if kind == 'heading':
+                    block = self._create_heading_block(match.group('heading_text'), len(match.group('hashes')))
+                elif kind == 'list':
+                    # 检查是否是 Todo
+                    mark = match.group('mark')
+                    content = match.group('item').rstrip()
+                    if mark is None:
+                        block = self._create_bulleted_list_item(content)
+                    else:
+                        block = self._create_todo_block(content, mark == 'x')
+                elif kind == 'numbered':
+                    block = self._create_numbered_list_item(match.group('numbered_text').rstrip())
+                else:
+                    block = self._create_quote_block(match.group('quote_text').rstrip())
+
+            append(block)
+            self._cache_block(line, block)
+
+        # 未闭合的代码块保留到文件末尾
+        if code_lines is not None:
+            append(self._create_code_block('\n'.join(code_lines), language))
             
         return blocks
 
+    def _cache_block(self, line: str, block: Dict[str, Any]):
+        """缓存一行生成的 Block，解析器可能在多个线程中同时使用，写入时加锁。"""
+        if len(line) > BLOCK_CACHE_MAX_LINE_LENGTH:
+            return
+        with self._block_cache_lock:
+            cache = self._block_cache
+            if len(cache) >= BLOCK_CACHE_SIZE:
+                del cache[next(iter(cache))]
+            cache[line] = block
+
     def _create_rich_text(self, text: str) -> List[Dict]:
         """
         处理行内样式（Bold, Italic, Link, Code）并返回 Rich Text 对象列表。
@@ -210,18 +293,8 @@ class MarkdownParser:
         """
         # 简单处理：将 [[Link]] 替换为 Link 文本，不带跳转（因为不知道目标 ID）
         # 将 Obsidian 图片 ![[img]] 替换为文本说明
-        
-        # 替换 Obsidian 图片语法为说明文本
-        # 注意：必须在 Wikilink 替换之前执行，因为 ![[...]] 包含 [[...]]
-        text = self.obsidian_image_pattern.sub(r'[Image: \1]', text)
-
-        # 替换 Wikilinks
-        def replace_wikilink(match):
-            page = match.group(1)
-            alias = match.group(2)
-            return alias if alias else page
-        
-        text = self.wikilink_pattern.sub(replace_wikilink, text)
+        if '[[' in text:
+            text = self._INLINE_RE.sub(self._replace_inline, text)
         
         # TODO: 支持更多 Markdown 行内样式解析 (Bold, Italic, etc.)
         # Notion API 需要把文本切分成多个 text object 才能应用不同的 annotations
@@ -233,8 +306,20 @@ class MarkdownParser:
             
         return [{"text": {"content": text}}]
 
+    @staticmethod
+    def _replace_inline(match: re.Match) -> str:
+        """_INLINE_RE 的替换函数：图片转为说明文本，WikiLink 转为别名或页面名。"""
+        image = match.group('img')
+        if image is not None:
+            return f"[Image: {image}]"
+        return match.group('alias') or match.group('page')
+
     def _is_image_line(self, line: str) -> bool:
-        return bool(self.md_image_pattern.match(line.strip()) or self.obsidian_image_pattern.match(line.strip()))
+        stripped = line.lstrip()
+        # 绝大多数行不以 ! 开头，先用字符串比较快速排除，避免执行正则
+        if not stripped.startswith('!'):
+            return False
+        return bool(self.md_image_pattern.match(stripped) or self.obsidian_image_pattern.match(stripped))
 
     def _create_image_block(self, line: str) -> Optional[Dict]:
         """尝试创建图片块。仅支持网络图片 URL。"""
@@ -5,29 +5,90 @@ Notion API Adapter module.
 Author: wdblink
 """
 
-from typing import List, Dict, Any, Optional
+import time
+import dataclasses
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Dict, Any, Optional
+import httpx
 from notion_client import Client
-from notion_client.errors import APIResponseError
+from notion_client.client import ClientOptions
+from notion_client.errors import APIErrorCode, APIResponseError
 from .utils import setup_logger
 
 logger = setup_logger(__name__)
 
+# 遇到限速（HTTP 429）时的最大重试次数
+MAX_RATE_LIMIT_RETRIES = 5
+# notion-client 3.x 自带重试 (retry 选项)，重试统一由 _request 处理，避免两层重试叠加
+CLIENT_RETRY_CONFIGURABLE = "retry" in {field.name for field in dataclasses.fields(ClientOptions)}
+# Notion API 限制每次创建或追加最多 100 个 block
+MAX_BLOCKS_PER_REQUEST = 100
+# 安装了 h2 (pip install httpx[http2]) 时启用 HTTP/2，多个并发请求复用同一条连接
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
 class NotionAdapter:
     """
     Notion API 适配器类。
     
     Attributes:
         client (Client): Notion 官方客户端实例。
+        http_client (httpx.Client): Notion 客户端使用的 HTTP 连接池。
+        max_workers (int): 批量删除块时的并发请求数。
+        executor (ThreadPoolExecutor): 并发请求使用的线程池，在适配器生命周期内复用。
     """
 
-    def __init__(self, token: str):
+    def __init__(self, token: str, max_workers: int = 3):
         """
         初始化 Notion 适配器。
         
         Args:
             token: Notion Integration Token.
+            max_workers: 批量删除块时的并发请求数。
         """
-        self.client = Client(auth=token)
+        # 显式创建 HTTP 连接池：整个适配器生命周期内复用 TLS 连接。
+        # 文件级同步线程与本适配器的线程池都会并发发起请求，保活连接数按两者之和设置
+        self.http_client = httpx.Client(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=max_workers * 2),
+        )
+        client_options = {"retry": False} if CLIENT_RETRY_CONFIGURABLE else {}
+        self.client = Client(auth=token, client=self.http_client, **client_options)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="notion")
+
+    def close(self):
+        """释放线程池和 HTTP 连接，等待进行中的请求完成。"""
+        self.executor.shutdown(wait=True)
+        self.http_client.close()
+
+    def _request(self, method: Callable[..., Any], **kwargs) -> Any:
+        """
+        调用 Notion API，遇到限速时按 Retry-After 等待后重试。
+        
+        Args:
+            method: Notion 客户端方法，如 self.client.pages.create。
+            **kwargs: 传给该方法的参数。
+            
+        Returns:
+            API 响应。
+            
+        Raises:
+            APIResponseError: 非限速错误，或重试次数用尽。
+        """
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            try:
+                return method(**kwargs)
+            except APIResponseError as e:
+                if e.code != APIErrorCode.RateLimited or attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                # 优先使用服务端返回的 Retry-After，否则指数退避
+                try:
+                    delay = float(e.headers.get("retry-after"))
+                except (AttributeError, TypeError, ValueError):
+                    delay = 2 ** attempt
+                logger.warning(f"Rate limited by Notion API, retrying in {delay}s")
+                time.sleep(delay)
 
     def query_database(self, database_id: str, filter_params: Optional[Dict] = None) -> List[Dict]:
         """
@@ -46,7 +107,8 @@ class NotionAdapter:
 
         try:
             while has_more:
-                response = self.client.databases.query(
+                response = self._request(
+                    self.client.databases.query,
                     database_id=database_id,
                     filter=filter_params,
                     start_cursor=start_cursor
@@ -59,6 +121,25 @@ class NotionAdapter:
             logger.error(f"Failed to query database: {e}")
             raise
 
+    def list_all_pages(self, database_id: str) -> List[Dict[str, str]]:
+        """
+        列出数据库中的所有页面及其标题。
+        
+        Args:
+            database_id: 数据库 ID。
+            
+        Returns:
+            页面列表，每项包含 id 和 title（标题属性 Name 的纯文本）。
+        """
+        pages = []
+        for page in self.query_database(database_id):
+            title_parts = page.get("properties", {}).get("Name", {}).get("title", [])
+            pages.append({
+                "id": page["id"],
+                "title": "".join(part.get("plain_text", "") for part in title_parts)
+            })
+        return pages
+
     def create_page(self, database_id: str, properties: Dict, children: List[Dict]) -> Optional[Dict]:
         """
         在指定数据库中创建新页面。
@@ -72,18 +153,47 @@ class NotionAdapter:
             创建的页面对象，失败则返回 None。
         """
         try:
-            response = self.client.pages.create(
+            # 第一批内容随创建请求一起发送，其余的再分批追加
+            response = self._request(
+                self.client.pages.create,
                 parent={"database_id": database_id},
                 properties=properties,
-                children=children
+                children=children[:MAX_BLOCKS_PER_REQUEST]
             )
             logger.info(f"Created page: {response.get('id')}")
+            if len(children) > MAX_BLOCKS_PER_REQUEST:
+                self._append_blocks(response["id"], children[MAX_BLOCKS_PER_REQUEST:])
             return response
         except APIResponseError as e:
             logger.error(f"Failed to create page: {e}")
             # 这里的 children 可能因为格式错误导致失败，可以考虑只创建页面不带内容，再排查
             return None
 
+    def create_pages_batch(self, database_id: str, payloads: List[Dict]) -> List[Optional[Dict]]:
+        """
+        并发创建多个页面，并发数受线程池大小限制。
+        
+        Args:
+            database_id: 目标数据库 ID。
+            payloads: 每项包含 properties 和 children，含义同 create_page。
+            
+        Returns:
+            与 payloads 顺序一致的页面对象列表，创建失败的项为 None。
+        """
+        futures = [
+            self.executor.submit(self.create_page, database_id, payload["properties"], payload["children"])
+            for payload in payloads
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # create_page 只处理 API 错误，网络错误等只影响对应的页面
+                logger.error(f"Failed to create page: {e}")
+                results.append(None)
+        return results
+
     def update_page(self, page_id: str, properties: Optional[Dict] = None, children: Optional[List[Dict]] = None) -> bool:
         """
         更新页面属性和内容。
@@ -101,7 +211,7 @@ class NotionAdapter:
         try:
             # 1. 更新属性
             if properties:
-                self.client.pages.update(page_id=page_id, properties=properties)
+                self._request(self.client.pages.update, page_id=page_id, properties=properties)
                 logger.info(f"Updated properties for page: {page_id}")
 
             # 2. 更新内容（如果提供）
@@ -115,44 +225,57 @@ class NotionAdapter:
 
     def _replace_page_content(self, page_id: str, new_blocks: List[Dict]):
         """
-        替换页面内容：清空现有块，添加新块。
+        替换页面内容：删除现有块，添加新块。
+        
+        新块总是追加在页面末尾，因此删除旧块与追加新块可以同时进行，
+        追加请求之间仍按顺序发送以保证内容顺序。
         
         Args:
             page_id: 页面 ID。
             new_blocks: 新的内容块列表。
         """
-        # 1. 获取现有块并删除
-        # 注意：Notion API 不支持直接“清空”，需要遍历删除
-        # 为了避免过多请求，如果页面很长可能会很慢
+        # 注意：Notion API 不支持直接“清空”，需要逐个删除
+        # 先收集所有块 ID（边分页边删除会打乱游标），再并发删除
         try:
+            block_ids = []
             has_more = True
             start_cursor = None
             
             while has_more:
-                response = self.client.blocks.children.list(block_id=page_id, start_cursor=start_cursor)
-                blocks = response.get("results", [])
-                
-                for block in blocks:
-                    self.client.blocks.delete(block_id=block["id"])
-                
+                response = self._request(self.client.blocks.children.list, block_id=page_id, start_cursor=start_cursor)
+                block_ids.extend(block["id"] for block in response.get("results", []))
                 has_more = response.get("has_more", False)
                 start_cursor = response.get("next_cursor")
             
-            logger.info(f"Cleared content for page: {page_id}")
-
-            # 2. 添加新块
-            # Notion API 限制每次 append 最多 100 个 block
-            batch_size = 100
-            for i in range(0, len(new_blocks), batch_size):
-                batch = new_blocks[i:i + batch_size]
-                self.client.blocks.children.append(block_id=page_id, children=batch)
+            deletions = [
+                self.executor.submit(self._request, self.client.blocks.delete, block_id=block_id)
+                for block_id in block_ids
+            ]
+            try:
+                self._append_blocks(page_id, new_blocks)
+            finally:
+                # 等待全部删除完成；result() 以便在删除失败时抛出异常
+                for deletion in deletions:
+                    deletion.result()
             
-            logger.info(f"Appended new content to page: {page_id}")
+            logger.info(f"Replaced content for page: {page_id}")
             
         except APIResponseError as e:
             logger.error(f"Failed to replace page content for {page_id}: {e}")
             raise
 
+    def _append_blocks(self, block_id: str, blocks: List[Dict]):
+        """
+        按顺序分批追加内容块。
+        
+        Args:
+            block_id: 父块（页面）ID。
+            blocks: 要追加的内容块列表。
+        """
+        for i in range(0, len(blocks), MAX_BLOCKS_PER_REQUEST):
+            batch = blocks[i:i + MAX_BLOCKS_PER_REQUEST]
+            self._request(self.client.blocks.children.append, block_id=block_id, children=batch)
+
     def find_page_by_title(self, database_id: str, title: str) -> Optional[Dict]:
         """
         根据标题查找页面（假设标题是唯一标识符，或者只取第一个）。
@@ -8,15 +8,74 @@ Author: wdblink
 import os
 import json
 import hashlib
+import sqlite3
+import stat as stat_module
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from .config import get_config
 from .notion_adapter import NotionAdapter
 from .markdown_parser import MarkdownParser
 from .utils import setup_logger
 
+try:
+    # orjson 为可选依赖，安装后计算内容块哈希时序列化更快
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # xxhash 为可选依赖，HASH_ALGO=xxh3_64 时使用
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    # watchdog 为可选依赖，监听模式 (--watch) 使用
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
 logger = setup_logger(__name__)
 
+# 计算文件哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 64 * 1024
+# 早期版本的状态文件没有记录哈希算法，当时固定使用 MD5
+LEGACY_HASH_ALGO = "md5"
+# 状态库 files 表中除 path 外的列，与 state 中每个条目的键一一对应
+STATE_FIELDS = ("mtime_ns", "size", "hash", "hash_algo", "blocks_hash", "page_id")
+# 每处理这么多个文件统一创建一次新页面，同时限制内存中待创建页面的数量
+SYNC_BATCH_SIZE = 100
+
+def _new_hasher(algo: str):
+    """创建指定算法的哈希对象，算法名称见 config.SUPPORTED_HASH_ALGOS。"""
+    if algo == "xxh3_64":
+        return xxhash.xxh3_64()
+    if algo == "blake2b":
+        # 16 字节摘要与 MD5 等长，足够用于变更检测
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algo)
+
+def _page_title(properties: Dict) -> str:
+    """取出页面属性中的标题文本。"""
+    return properties.get("Name", {}).get("title", [{}])[0].get("text", {}).get("content", "")
+
+def _warn_shared_page(page_id: str, pending: List[Tuple[str, Dict, List[Dict], Dict]]):
+    """多个文件对应同一页面时记录警告，页面内容以最后一个文件为准。"""
+    if len(pending) > 1:
+        paths = ", ".join(relative_path for relative_path, _, _, _ in pending)
+        logger.warning(f"Multiple files map to page {page_id}: {paths}")
+
+def _hash_bytes(data: bytes, algo: str) -> str:
+    """计算一段内存数据的哈希值。"""
+    hasher = _new_hasher(algo)
+    hasher.update(data)
+    return hasher.hexdigest()
+
 class SyncService:
     """
     同步服务类。
@@ -25,115 +84,551 @@ class SyncService:
         config: 应用配置。
         notion: Notion 适配器。
         parser: Markdown 解析器。
-        state_file: 同步状态文件路径。
-        state: 当前同步状态。
+        state_file: 同步状态库（SQLite）路径。
+        state: 当前同步状态，启动时从状态库整体载入内存。
+        state_lock: 保护 state 的锁，文件在多个线程中并发同步。
+        title_index: 数据库中页面标题到 page_id 的映射，每次同步时按需构建。
     """
 
     def __init__(self):
         self.config = get_config()
-        self.notion = NotionAdapter(self.config.NOTION_TOKEN)
+        self.notion = NotionAdapter(self.config.NOTION_TOKEN, max_workers=self.config.SYNC_MAX_WORKERS)
+        # 同步过程中频繁使用的配置项，构造时读取一次
+        self._vault = self.config.OBSIDIAN_VAULT_PATH
+        self._db_id = self.config.NOTION_DATABASE_ID
+        self._hash_algo = self.config.HASH_ALGO
         self.parser = MarkdownParser()
-        self.state_file = Path("sync_state.json")
+        self.state_file = Path("sync_state.db")
+        # 有改动的条目，保存时只写回这些行
+        self._dirty_paths: Set[str] = set()
         self.state = self._load_state()
+        self.state_lock = threading.Lock()
+        self.title_index: Optional[Dict[str, str]] = None
+        # 本次同步中构建标题索引失败的原因，失败后不再重复查询整个数据库
+        self._title_index_error: Optional[Exception] = None
+        self._title_index_lock = threading.Lock()
+        # 监听模式下收到变更事件、尚未同步的文件
+        self._pending_paths: Set[str] = set()
+        self._pending_lock = threading.Lock()
+
+    def close(self):
+        """释放 Notion 适配器持有的资源。"""
+        self.notion.close()
+
+    def _connect_state_db(self) -> sqlite3.Connection:
+        """打开状态库，不存在时创建表。"""
+        conn = sqlite3.connect(self.state_file)
+        # WAL 模式下 NORMAL 同步级别仍能保证崩溃后数据库不损坏
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash TEXT, "
+            "hash_algo TEXT, blocks_hash TEXT, page_id TEXT)"
+        )
+        return conn
 
     def _load_state(self) -> Dict:
-        """加载同步状态文件。"""
-        if self.state_file.exists():
+        """
+        加载同步状态。
+        
+        状态库不存在但有旧版的 sync_state.json 时从中迁移，下次保存时写入状态库。
+        """
+        if not self.state_file.exists():
+            return self._load_legacy_state()
+        try:
+            conn = self._connect_state_db()
             try:
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Failed to load state file: {e}")
-                return {}
-        return {}
+                rows = conn.execute(f"SELECT path, {', '.join(STATE_FIELDS)} FROM files").fetchall()
+            finally:
+                conn.close()
+            # 旧记录缺少的字段在库中为 NULL，载入时去掉，与缺少该键的语义一致；
+            # 路径驻留后与遍历产生的键是同一个对象，查找时无需逐字符比较
+            return {
+                sys.intern(path): {key: value for key, value in zip(STATE_FIELDS, values) if value is not None}
+                for path, *values in rows
+            }
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load state database: {e}")
+            return {}
 
-    def _save_state(self):
-        """保存同步状态文件。"""
+    def _load_legacy_state(self) -> Dict:
+        """读取旧版 JSON 状态文件，所有条目标记为待保存。"""
+        legacy_file = self.state_file.with_suffix(".json")
+        if not legacy_file.exists():
+            return {}
         try:
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(self.state, f, indent=2, ensure_ascii=False)
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
         except Exception as e:
-            logger.error(f"Failed to save state file: {e}")
+            logger.error(f"Failed to load legacy state file: {e}")
+            return {}
+        logger.info(f"Migrating sync state from {legacy_file} to {self.state_file}")
+        self._dirty_paths.update(state)
+        return state
+
+    def _save_state(self):
+        """
+        保存同步状态。
+        
+        只写回本次有改动的条目，在一个事务中提交，中途中断不会损坏状态库。
+        """
+        if not self._dirty_paths:
+            return
+        rows = [
+            (path, *(self.state[path].get(key) for key in STATE_FIELDS))
+            for path in self._dirty_paths
+            if path in self.state
+        ]
+        try:
+            conn = self._connect_state_db()
+            try:
+                with conn:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO files (path, {', '.join(STATE_FIELDS)}) "
+                        f"VALUES ({', '.join('?' * (len(STATE_FIELDS) + 1))})",
+                        rows
+                    )
+            finally:
+                conn.close()
+            self._dirty_paths.clear()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to save state database: {e}")
+
+    def _calculate_file_hash(self, file_path: Path, algo: Optional[str] = None) -> str:
+        """
+        计算文件内容的哈希值，默认使用配置的 HASH_ALGO。
 
-    def _calculate_file_hash(self, file_path: Path) -> str:
-        """计算文件内容的 MD5 哈希值。"""
+        使用固定大小的缓冲区分块读取，避免将整个文件读入内存。
+        不使用 mmap：文件在哈希期间被截断时访问映射会触发 SIGBUS，进程直接退出。
+        """
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+            hasher = _new_hasher(algo or self._hash_algo)
+            with open(file_path, 'rb', buffering=0) as f:
+                buffer = bytearray(HASH_CHUNK_SIZE)
+                view = memoryview(buffer)
+                while True:
+                    n = f.readinto(view)
+                    if not n:
+                        break
+                    hasher.update(view[:n])
+            return hasher.hexdigest()
         except Exception:
             return ""
 
+    def _read_and_hash(self, file_path: Path, algo: Optional[str] = None) -> Tuple[bytearray, str]:
+        """
+        读取文件内容并同时计算哈希值，默认使用配置的 HASH_ALGO。
+        
+        按文件大小预先分配缓冲区，分块读入的同时更新哈希，只读取一遍且不额外复制。
+        
+        Returns:
+            (文件内容, 哈希值) 元组。
+        """
+        hasher = _new_hasher(algo or self._hash_algo)
+        with open(file_path, 'rb', buffering=0) as f:
+            buffer = bytearray(os.fstat(f.fileno()).st_size)
+            pos = 0
+            with memoryview(buffer) as view:
+                while pos < len(buffer):
+                    n = f.readinto(view[pos:pos + HASH_CHUNK_SIZE])
+                    if not n:
+                        break
+                    hasher.update(view[pos:pos + n])
+                    pos += n
+            # 文件在读取期间被截断或追加
+            del buffer[pos:]
+            rest = f.read()
+            if rest:
+                hasher.update(rest)
+                buffer += rest
+        return buffer, hasher.hexdigest()
+
+    def _calculate_blocks_hash(self, blocks: List[Dict]) -> str:
+        """
+        计算 Notion 内容块的哈希值，用于判断正文是否变化。
+        
+        有无 orjson 时序列化结果逐字节相同，哈希值不受是否安装 orjson 影响。
+        """
+        if orjson is not None:
+            serialized = orjson.dumps(blocks, option=orjson.OPT_SORT_KEYS)
+        else:
+            serialized = json.dumps(
+                blocks, sort_keys=True, ensure_ascii=False, separators=(',', ':')
+            ).encode('utf-8')
+        return _hash_bytes(serialized, self._hash_algo)
+
+    def _find_page_id_by_title(self, title: str) -> Optional[str]:
+        """
+        根据标题查找数据库中已存在的页面。
+        
+        首次调用时一次性查询整个数据库并建立标题索引，之后在本地查找，
+        避免每个文件都发起一次数据库查询。
+        查询失败后，本次同步的其余调用直接抛出异常，不再重复扫描数据库。
+        
+        Raises:
+            RuntimeError: 本次同步中标题索引构建失败。
+        """
+        with self._title_index_lock:
+            if self.title_index is None:
+                if self._title_index_error is not None:
+                    raise RuntimeError(f"Page title index unavailable: {self._title_index_error}")
+                index: Dict[str, str] = {}
+                try:
+                    for page in self.notion.list_all_pages(self._db_id):
+                        # 与按标题查询的行为一致，重名时取第一个
+                        index.setdefault(page["title"], page["id"])
+                except Exception as e:
+                    self._title_index_error = e
+                    raise
+                self.title_index = index
+            return self.title_index.get(title)
+
     def sync(self):
         """执行一次完整的同步流程。"""
         logger.info("Starting sync process...")
         
-        vault_path = self.config.OBSIDIAN_VAULT_PATH
+        vault_path = self._vault
         if not vault_path.exists():
             logger.error(f"Vault path does not exist: {vault_path}")
             return
 
-        # 遍历所有 Markdown 文件
-        for file_path in vault_path.rglob("*.md"):
-            self._sync_file(file_path, vault_path)
-        
-        self._save_state()
+        # 全量扫描覆盖了此前收到的所有变更事件
+        with self._pending_lock:
+            self._pending_paths.clear()
+        self._sync_files(self._iter_markdown_files(vault_path))
         logger.info("Sync process completed.")
 
-    def _sync_file(self, file_path: Path, root_path: Path):
-        """同步单个文件。"""
-        try:
-            relative_path = str(file_path.relative_to(root_path))
-            current_mtime = file_path.stat().st_mtime
-            current_hash = self._calculate_file_hash(file_path)
-
-            # 检查是否需要更新
-            file_state = self.state.get(relative_path, {})
-            last_hash = file_state.get("hash")
+    def watch(self):
+        """
+        监听仓库中的文件变化，变化的文件加入待同步队列，由 sync_pending 处理。
+        
+        需要安装 watchdog。监听开始前的变化不会产生事件，调用方应先执行一次 sync。
+        
+        Returns:
+            已启动的 watchdog Observer，调用方负责 stop() 和 join()。
             
-            # 如果哈希值未变，则跳过
-            if last_hash == current_hash:
-                logger.debug(f"Skipping unchanged file: {relative_path}")
-                return
+        Raises:
+            RuntimeError: 未安装 watchdog。
+        """
+        if Observer is None:
+            raise RuntimeError("Watch mode requires watchdog: pip install watchdog")
+        observer = Observer()
+        observer.schedule(_VaultEventHandler(self), str(self._vault), recursive=True)
+        observer.start()
+        return observer
 
-            logger.info(f"Syncing file: {relative_path}")
-            
-            # 解析文件
-            properties, blocks = self.parser.parse_file(file_path)
-            if not properties:
-                logger.warning(f"Failed to parse properties for {relative_path}")
-                return
+    def enqueue(self, path: str):
+        """
+        将发生变化的文件加入待同步队列，可在任意线程中调用。
+        
+        Args:
+            path: 文件路径，非 Markdown 文件和仓库之外的路径会被忽略。
+        """
+        if not path.endswith(".md"):
+            return
+        relative_path = os.path.relpath(path, self._vault)
+        if relative_path.startswith(os.pardir + os.sep):
+            return
+        with self._pending_lock:
+            self._pending_paths.add(sys.intern(relative_path))
+
+    def sync_pending(self):
+        """只同步待同步队列中的文件，不遍历整个仓库。"""
+        with self._pending_lock:
+            relative_paths = self._pending_paths
+            self._pending_paths = set()
+        if not relative_paths:
+            return
+        logger.info(f"Syncing {len(relative_paths)} changed file(s)...")
+        self._sync_files(self._stat_files(relative_paths))
+
+    def _stat_files(self, relative_paths: Iterable[str]) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        获取待同步文件的 stat 结果，跳过已删除或不是普通文件的路径。
+        
+        Yields:
+            (相对路径, stat 结果) 元组，与 _iter_markdown_files 相同。
+        """
+        for relative_path in relative_paths:
+            try:
+                stat = os.stat(self._vault / relative_path)
+            except OSError:
+                continue
+            if stat_module.S_ISREG(stat.st_mode):
+                yield relative_path, stat
 
+    def _sync_files(self, files: Iterable[Tuple[str, os.stat_result]]):
+        """
+        同步给定的文件，修改时间和大小都未变的文件直接跳过。
+        
+        Args:
+            files: (相对路径, stat 结果) 序列。
+        """
+        # 数据库可能在两次同步之间被修改，索引只在单次同步内有效
+        self.title_index = None
+        self._title_index_error = None
+
+        # 同步中途出错也保存已完成的部分，状态在一次同步结束时统一写入
+        try:
+            # 可能有变化的文件按批处理：
+            # 读取、哈希和解析在本地线程池中并行，线程数与 CPU 核数相当；
+            # Notion 请求受限速约束，使用 SYNC_MAX_WORKERS 个线程
+            with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as local_executor:
+                with ThreadPoolExecutor(max_workers=self.config.SYNC_MAX_WORKERS) as executor:
+                    batch = []
+                    for relative_path, stat in files:
+                        # 修改时间和大小都未变，直接跳过：既不读取文件，也不交给线程池
+                        file_state = self.state.get(relative_path)
+                        if (file_state
+                                and file_state.get("mtime_ns") == stat.st_mtime_ns
+                                and file_state.get("size") == stat.st_size):
+                            logger.debug(f"Skipping unchanged file: {relative_path}")
+                            continue
+                        batch.append((relative_path, stat))
+                        if len(batch) >= SYNC_BATCH_SIZE:
+                            self._sync_batch(batch, local_executor, executor)
+                            batch = []
+                    self._sync_batch(batch, local_executor, executor)
+        finally:
+            self._save_state()
+
+    def _iter_markdown_files(self, root_path: Path) -> Iterator[Tuple[str, os.stat_result]]:
+        """
+        递归遍历目录下的所有 Markdown 文件。
+        
+        基于 os.scandir 实现，遍历时直接拼接相对路径，不创建 Path 对象，
+        并直接返回文件的 stat 结果供变更检测使用。
+        不会进入符号链接指向的目录，与 Path.rglob 的行为一致。
+        
+        Yields:
+            (相对于 root_path 的路径, stat 结果) 元组。
+        """
+        stack = [(str(root_path), "")]
+        while stack:
+            directory, prefix = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, prefix + entry.name + os.sep))
+                        elif entry.name.endswith(".md") and entry.is_file():
+                            try:
+                                stat = entry.stat()
+                            except OSError:
+                                # 文件在遍历期间被删除
+                                continue
+                            yield sys.intern(prefix + entry.name), stat
+            except OSError as e:
+                logger.warning(f"Failed to scan directory {directory}: {e}")
+
+    def _sync_batch(self, batch: List[Tuple[str, os.stat_result]],
+                    local_executor: ThreadPoolExecutor, executor: ThreadPoolExecutor):
+        """
+        同步一批可能有变化的文件。
+        
+        先并行读取和解析，已有页面的更新交给 Notion 线程池，更新完成后再批量创建新页面。
+        多个文件对应同一页面时（如不同目录下的同名笔记），按顺序依次更新，不并发修改同一页面。
+        
+        Args:
+            batch: (相对路径, stat 结果) 列表。
+            local_executor: 读取、哈希和解析文件的线程池。
+            executor: 发起 Notion 请求的线程池。
+        """
+        if not batch:
+            return
+        # page_id -> 要写入该页面的文件，保持遍历顺序
+        updates: Dict[str, List[Tuple[str, Dict, List[Dict], Dict]]] = {}
+        creates = []
+        for prepared in local_executor.map(self._prepare_file, *zip(*batch)):
+            if prepared is None:
+                continue
+            relative_path, properties, _, _ = prepared
             # 获取已知的 page_id
-            page_id = file_state.get("page_id")
-            
+            page_id = self.state.get(relative_path, {}).get("page_id")
             # 如果本地状态没有 page_id，尝试通过标题在 Notion 中查找，防止重复创建
             if not page_id:
-                title = properties.get("Name", {}).get("title", [{}])[0].get("text", {}).get("content", "")
+                title = _page_title(properties)
                 if title:
-                    existing_page = self.notion.find_page_by_title(self.config.NOTION_DATABASE_ID, title)
-                    if existing_page:
-                        page_id = existing_page["id"]
+                    try:
+                        page_id = self._find_page_id_by_title(title)
+                    except Exception as e:
+                        logger.error(f"Error looking up page for {relative_path}: {e}")
+                        continue
+                    if page_id:
                         logger.info(f"Found existing page for {relative_path}: {page_id}")
-
-            success = False
             if page_id:
-                # 更新现有页面
-                success = self.notion.update_page(page_id, properties, blocks)
+                updates.setdefault(page_id, []).append(prepared)
             else:
-                # 创建新页面
-                result = self.notion.create_page(self.config.NOTION_DATABASE_ID, properties, blocks)
-                if result:
-                    page_id = result["id"]
-                    success = True
-
-            # 更新状态
-            if success and page_id:
-                self.state[relative_path] = {
-                    "mtime": current_mtime,
-                    "hash": current_hash,
-                    "page_id": page_id
-                }
+                creates.append(prepared)
+        futures = []
+        for page_id, pending in updates.items():
+            _warn_shared_page(page_id, pending)
+            futures.append(executor.submit(self._update_pages, page_id, pending))
+        for future in futures:
+            future.result()
+        self._create_pages(creates, executor)
+
+    def _update_pages(self, page_id: str, pending: List[Tuple[str, Dict, List[Dict], Dict]]):
+        """
+        依次用多个文件更新同一页面，最后一个文件的内容生效。
+        
+        Args:
+            page_id: 页面 ID。
+            pending: _prepare_file 的返回值列表。
+        """
+        for prepared in pending:
+            self._update_page(page_id, *prepared)
+
+    def _create_pages(self, pending: List[Tuple[str, Dict, List[Dict], Dict]], executor: ThreadPoolExecutor):
+        """
+        批量创建新页面，并记录创建成功的文件状态。
+        
+        同名的新笔记只创建一个页面，其余文件随后依次更新该页面，
+        与该标题的页面已存在时的行为一致。新页面加入标题索引，本次同步的后续批次也能找到。
+        
+        Args:
+            pending: _prepare_file 的返回值列表。
+            executor: 发起 Notion 请求的线程池。
+        """
+        if not pending:
+            return
+        # 标题 -> 同名的文件，没有标题的文件各自单独创建
+        groups: Dict[str, List[Tuple[str, Dict, List[Dict], Dict]]] = {}
+        for prepared in pending:
+            groups.setdefault(_page_title(prepared[1]) or prepared[0], []).append(prepared)
+        results = self.notion.create_pages_batch(
+            self._db_id,
+            [{"properties": group[0][1], "children": group[0][2]} for group in groups.values()]
+        )
+        futures = []
+        for group, result in zip(groups.values(), results):
+            if not result:
+                continue
+            relative_path, properties, _, entry = group[0]
+            page_id = result["id"]
+            entry["page_id"] = page_id
+            with self.state_lock:
+                self.state[relative_path] = entry
+                self._dirty_paths.add(relative_path)
+            with self._title_index_lock:
+                title = _page_title(properties)
+                if title and isinstance(self.title_index, dict):
+                    self.title_index.setdefault(title, page_id)
+            logger.info(f"Successfully synced: {relative_path}")
+            if len(group) > 1:
+                _warn_shared_page(page_id, group)
+                futures.append(executor.submit(self._update_pages, page_id, group[1:]))
+        for future in futures:
+            future.result()
+
+    def _update_page(self, page_id: str, relative_path: str, properties: Dict, blocks: List[Dict], entry: Dict):
+        """
+        更新已有页面，并记录更新成功的文件状态。
+        
+        Args:
+            page_id: 页面 ID。
+            relative_path: 相对于仓库根目录的路径，作为状态的键。
+            properties: 页面属性。
+            blocks: 页面内容块。
+            entry: 待记录的文件状态。
+        """
+        try:
+            # 正文未变时只更新属性，避免整页删除重建
+            file_state = self.state.get(relative_path, {})
+            children = blocks
+            if file_state.get("page_id") == page_id and file_state.get("blocks_hash") == entry["blocks_hash"]:
+                children = None
+            if self.notion.update_page(page_id, properties, children):
+                entry["page_id"] = page_id
+                with self.state_lock:
+                    self.state[relative_path] = entry
+                    self._dirty_paths.add(relative_path)
                 logger.info(f"Successfully synced: {relative_path}")
+        except Exception as e:
+            logger.error(f"Error syncing file {relative_path}: {e}")
+
+    def _prepare_file(self, relative_path: str, stat: os.stat_result) -> Optional[Tuple[str, Dict, List[Dict], Dict]]:
+        """
+        读取并解析单个文件。调用方已根据 stat 判断文件可能发生了变化。
+        
+        只做本地工作，不发起 Notion 请求，可在多个线程中并行执行。
+        
+        Args:
+            relative_path: 相对于仓库根目录的路径，作为状态的键。
+            stat: 文件的 stat 结果。
+            
+        Returns:
+            内容有变化时返回 (relative_path, 页面属性, 页面内容块, 待记录的状态)，否则返回 None。
+        """
+        file_path = self._vault / relative_path
+        try:
+            file_state = self.state.get(relative_path, {})
+
+            # 大小未变（或旧记录没有大小）而修改时间变化，多半只是被 touch：
+            # 先流式计算哈希确认，不必把文件读入内存。
+            # 按状态中记录的算法比较，更换 HASH_ALGO 后旧记录仍然有效，
+            # 等文件真正变化、重新同步时再迁移到当前算法
+            if "hash" in file_state and file_state.get("size", stat.st_size) == stat.st_size:
+                stored_algo = file_state.get("hash_algo", LEGACY_HASH_ALGO)
+                if self._calculate_file_hash(file_path, stored_algo) == file_state["hash"]:
+                    logger.debug(f"Skipping unchanged file: {relative_path}")
+                    with self.state_lock:
+                        file_state["mtime_ns"] = stat.st_mtime_ns
+                        file_state["size"] = stat.st_size
+                        self._dirty_paths.add(relative_path)
+                    return None
+
+            # 大小变化说明内容必然变化，直接读取；哈希和解析共用同一份内容
+            algo = self._hash_algo
+            raw, current_hash = self._read_and_hash(file_path, algo)
+            # 解码后立即释放原始字节，解析时内存中只保留一份文件内容
+            content = raw.decode('utf-8')
+            del raw
+
+            logger.info(f"Syncing file: {relative_path}")
+            
+            # 解析文件
+            properties, blocks = self.parser.parse_file(file_path, stat.st_mtime, content)
+            if not properties:
+                logger.warning(f"Failed to parse properties for {relative_path}")
+                return None
+
+            entry = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "hash": current_hash,
+                "hash_algo": algo,
+                "blocks_hash": self._calculate_blocks_hash(blocks)
+            }
+            return relative_path, properties, blocks, entry
 
         except Exception as e:
             logger.error(f"Error syncing file {file_path}: {e}")
+            return None
+
+
+class _VaultEventHandler(FileSystemEventHandler):
+    """将 watchdog 的文件事件转交给 SyncService.enqueue。"""
+
+    def __init__(self, service: SyncService):
+        super().__init__()
+        self.service = service
+
+    # 只处理内容可能变化的事件；inotify 的 opened/closed_no_write 等事件
+    # 在同步读取文件或 Obsidian 打开笔记时也会产生，不应触发同步。
+    # 删除的文件不会从 Notion 中移除，因此也不处理删除事件
+
+    def on_created(self, event):
+        self._enqueue(event, event.src_path)
+
+    def on_modified(self, event):
+        self._enqueue(event, event.src_path)
+
+    def on_moved(self, event):
+        # 重命名后的新路径在 dest_path 中，原路径已不存在
+        self._enqueue(event, event.dest_path)
+
+    def _enqueue(self, event, path):
+        if not event.is_directory:
+            self.service.enqueue(os.fsdecode(path))
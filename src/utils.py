@@ -9,6 +9,23 @@ import logging
 import sys
 from .config import get_config
 
+def _get_log_level() -> str:
+    """读取配置中的日志级别，配置不可用时默认为 INFO。"""
+    try:
+        return get_config().LOG_LEVEL
+    except ValueError:
+        return "INFO"
+
+# 日志级别只在模块加载时读取一次，避免每次创建 logger 都重新加载配置
+_LOG_LEVEL = _get_log_level()
+
+# 所有模块共享同一个输出 handler，只在模块加载时创建一次
+_HANDLER = logging.StreamHandler(sys.stdout)
+_HANDLER.setLevel(_LOG_LEVEL)
+_HANDLER.setFormatter(logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+))
+
 def setup_logger(name: str) -> logging.Logger:
     """
     设置并获取 logger 实例。
@@ -19,22 +36,9 @@ def setup_logger(name: str) -> logging.Logger:
     Returns:
         配置好的 logging.Logger 实例.
     """
-    try:
-        config = get_config()
-        log_level = config.LOG_LEVEL
-    except ValueError:
-        log_level = "INFO"
-
     logger = logging.getLogger(name)
-    logger.setLevel(log_level)
-
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(log_level)
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        logger.setLevel(_LOG_LEVEL)
+        logger.addHandler(_HANDLER)
 
     return logger
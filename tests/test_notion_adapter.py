@@ -0,0 +1,144 @@
+"""
+Tests for Notion Adapter.
+
+Author: wdblink
+"""
+
+import unittest
+from unittest.mock import MagicMock, call, patch
+from notion_client.errors import APIErrorCode, APIResponseError
+from src.notion_adapter import NotionAdapter, CLIENT_RETRY_CONFIGURABLE, MAX_BLOCKS_PER_REQUEST, MAX_RATE_LIMIT_RETRIES
+
+def make_api_error(code: APIErrorCode, headers=None) -> APIResponseError:
+    """构造 APIResponseError，不依赖各版本 notion-client 不同的构造参数。"""
+    error = APIResponseError.__new__(APIResponseError)
+    error.code = code
+    error.headers = headers or {}
+    return error
+
+def make_blocks(count: int):
+    return [{"type": "paragraph", "index": i} for i in range(count)]
+
+class TestNotionAdapter(unittest.TestCase):
+    def setUp(self):
+        self.mock_client_patcher = patch('src.notion_adapter.Client')
+        self.MockClient = self.mock_client_patcher.start()
+        self.mock_client = self.MockClient.return_value
+        self.adapter = NotionAdapter("fake_token")
+
+    def tearDown(self):
+        self.adapter.close()
+        self.mock_client_patcher.stop()
+
+    def test_create_page_appends_remaining_blocks_in_order(self):
+        blocks = make_blocks(250)
+        self.mock_client.pages.create.return_value = {"id": "page_id"}
+
+        result = self.adapter.create_page("db_id", {"Name": {}}, blocks)
+
+        self.assertEqual(result, {"id": "page_id"})
+        self.assertEqual(self.mock_client.pages.create.call_args.kwargs["children"], blocks[:MAX_BLOCKS_PER_REQUEST])
+        self.assertEqual(self.mock_client.blocks.children.append.call_args_list, [
+            call(block_id="page_id", children=blocks[100:200]),
+            call(block_id="page_id", children=blocks[200:]),
+        ])
+
+    def test_create_small_page_sends_single_request(self):
+        blocks = make_blocks(3)
+        self.mock_client.pages.create.return_value = {"id": "page_id"}
+
+        self.adapter.create_page("db_id", {"Name": {}}, blocks)
+
+        self.assertEqual(self.mock_client.pages.create.call_args.kwargs["children"], blocks)
+        self.mock_client.blocks.children.append.assert_not_called()
+
+    def test_replace_page_content_deletes_listed_blocks(self):
+        events = []
+        listed_pages = iter([
+            {"results": [{"id": "b1"}, {"id": "b2"}], "has_more": True, "next_cursor": "cursor"},
+            {"results": [{"id": "b3"}], "has_more": False},
+        ])
+        self.mock_client.blocks.children.list.side_effect = lambda **kwargs: events.append("list") or next(listed_pages)
+        self.mock_client.blocks.children.append.side_effect = lambda **kwargs: events.append("append")
+        new_blocks = make_blocks(150)
+
+        self.adapter._replace_page_content("page_id", new_blocks)
+
+        # 先分页列出全部旧块，再开始追加
+        self.assertEqual(events[:2], ["list", "list"])
+        self.assertEqual(self.mock_client.blocks.children.list.call_args_list, [
+            call(block_id="page_id", start_cursor=None),
+            call(block_id="page_id", start_cursor="cursor"),
+        ])
+        deleted = [c.kwargs["block_id"] for c in self.mock_client.blocks.delete.call_args_list]
+        self.assertEqual(sorted(deleted), ["b1", "b2", "b3"])
+        self.assertEqual(self.mock_client.blocks.children.append.call_args_list, [
+            call(block_id="page_id", children=new_blocks[:100]),
+            call(block_id="page_id", children=new_blocks[100:]),
+        ])
+
+    def test_replace_page_content_raises_on_failed_delete(self):
+        self.mock_client.blocks.children.list.return_value = {
+            "results": [{"id": "b1"}, {"id": "b2"}], "has_more": False
+        }
+        def delete(block_id):
+            if block_id == "b2":
+                raise make_api_error(APIErrorCode.ObjectNotFound)
+        self.mock_client.blocks.delete.side_effect = delete
+
+        with self.assertRaises(APIResponseError):
+            self.adapter._replace_page_content("page_id", make_blocks(1))
+        # 即使删除失败，新内容也已追加
+        self.mock_client.blocks.children.append.assert_called_once()
+        self.assertFalse(self.adapter.update_page("page_id", None, make_blocks(1)))
+
+    def test_client_retries_disabled(self):
+        # 重试只在 _request 中进行一层
+        kwargs = self.MockClient.call_args.kwargs
+        if CLIENT_RETRY_CONFIGURABLE:
+            self.assertIs(kwargs["retry"], False)
+        else:
+            self.assertNotIn("retry", kwargs)
+
+    @patch('src.notion_adapter.time.sleep')
+    def test_request_honours_retry_after(self, mock_sleep):
+        method = MagicMock(side_effect=[
+            make_api_error(APIErrorCode.RateLimited, {"retry-after": "2"}),
+            "ok",
+        ])
+
+        self.assertEqual(self.adapter._request(method, page_id="page_id"), "ok")
+        mock_sleep.assert_called_once_with(2.0)
+        self.assertEqual(method.call_args_list, [call(page_id="page_id")] * 2)
+
+    @patch('src.notion_adapter.time.sleep')
+    def test_request_backs_off_without_retry_after(self, mock_sleep):
+        method = MagicMock(side_effect=[
+            make_api_error(APIErrorCode.RateLimited),
+            make_api_error(APIErrorCode.RateLimited, {"retry-after": "soon"}),
+            "ok",
+        ])
+
+        self.assertEqual(self.adapter._request(method), "ok")
+        self.assertEqual(mock_sleep.call_args_list, [call(1), call(2)])
+
+    @patch('src.notion_adapter.time.sleep')
+    def test_request_reraises_other_errors(self, mock_sleep):
+        method = MagicMock(side_effect=make_api_error(APIErrorCode.ObjectNotFound))
+
+        with self.assertRaises(APIResponseError):
+            self.adapter._request(method)
+        method.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch('src.notion_adapter.time.sleep')
+    def test_request_gives_up_after_max_retries(self, mock_sleep):
+        method = MagicMock(side_effect=make_api_error(APIErrorCode.RateLimited, {"retry-after": "1"}))
+
+        with self.assertRaises(APIResponseError):
+            self.adapter._request(method)
+        self.assertEqual(method.call_count, MAX_RATE_LIMIT_RETRIES + 1)
+        self.assertEqual(mock_sleep.call_count, MAX_RATE_LIMIT_RETRIES)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,10 @@ Tests for Markdown Parser.
 Author: wdblink
 """
 
+import io
+import random
 import unittest
+import tempfile
 from pathlib import Path
 from src.markdown_parser import MarkdownParser
 
@@ -24,6 +27,58 @@ Content"""
         self.assertEqual(str(frontmatter['date']), '2023-01-01')
         self.assertEqual(body.strip(), "# Title\nContent")
 
+    def test_non_mapping_frontmatter_ignored(self):
+        frontmatter, body = self.parser._extract_frontmatter("---\n- a\n- b\n---\nBody")
+        self.assertEqual(frontmatter, {})
+        self.assertEqual(body, "Body")
+
+    def test_frontmatter_closes_at_first_fence(self):
+        frontmatter, body = self.parser._extract_frontmatter("---\na: 1\n---\nb: 2\n---\nBody")
+        self.assertEqual(frontmatter, {'a': 1})
+        self.assertEqual(body, "b: 2\n---\nBody")
+
+    def test_empty_frontmatter_block_is_body(self):
+        # 结束的 --- 与起始行之间至少要有一行，紧邻的两行 --- 不构成 Frontmatter
+        content = "---\n---\nBody\n"
+        self.assertEqual(self.parser._extract_frontmatter(content), ({}, content))
+
+    def test_unclosed_frontmatter_is_body(self):
+        content = "---\na: 1\nBody\n"
+        self.assertEqual(self.parser._extract_frontmatter(content), ({}, content))
+
+    def test_strip_newlines_matches_split(self):
+        for text in ("", "a", "a\n", "a\nb", "a\nb\n", "\n\n"):
+            self.assertEqual(list(self.parser._strip_newlines(io.StringIO(text))), text.split('\n'))
+
+    def test_streamed_body_matches_split(self):
+        # 按行流式解析与对整段正文 split 后解析的结果一致
+        pieces = ["# H", "- item", "- [x] done", "1. one", "> quote", "```py", "```", "", "  ",
+                  "text [[Page|alias]]", "![alt](https://example.com/a.png)", "![[img.png]]", "plain"]
+        rng = random.Random(0)
+        for _ in range(500):
+            body = "\n".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+            if rng.random() < 0.5:
+                body += "\n"
+            self.assertEqual(
+                self.parser._parse_body_lines(self.parser._strip_newlines(io.StringIO(body))),
+                self.parser._parse_body_to_blocks(body),
+                body
+            )
+
+    def test_parse_file_with_content(self):
+        content = "---\r\ntags: [note]\r\n---\r\n# Title\r\n```py\r\ncode\r\n```\r\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            file_path = Path(tmp) / "note.md"
+            file_path.write_bytes(content.encode('utf-8'))
+            # 传入已读取的内容与直接读文件的结果一致
+            self.assertEqual(
+                self.parser.parse_file(file_path, content=content),
+                self.parser.parse_file(file_path)
+            )
+            properties, blocks = self.parser.parse_file(file_path, content=content)
+        self.assertEqual(properties['Tags']['multi_select'], [{'name': 'note'}])
+        self.assertEqual(blocks[1]['code']['rich_text'][0]['text']['content'], 'code')
+
     def test_parse_simple_blocks(self):
         body = """# Heading 1
 - List Item 1
@@ -51,6 +106,16 @@ Content"""
         content = rich_text[0]['text']['content']
         self.assertEqual(content, "Image [Image: image.png] here.")
 
+    def test_mixed_inline_replacement(self):
+        text = "See ![[a.png]] and [[Page|Alias]] then [[Other]]."
+        rich_text = self.parser._create_rich_text(text)
+        content = rich_text[0]['text']['content']
+        self.assertEqual(content, "See [Image: a.png] and Alias then Other.")
+
+        # 孤立的 [[ 不会吞掉其后的图片嵌入
+        content = self.parser._create_rich_text("Type [[ to link, e.g. ![[diagram.png]]")[0]['text']['content']
+        self.assertEqual(content, "Type [[ to link, e.g. [Image: diagram.png]")
+
     def test_external_image_block(self):
         line = "![alt](https://example.com/image.png)"
         block = self.parser._create_image_block(line)
@@ -58,5 +123,20 @@ Content"""
         self.assertEqual(block['type'], 'image')
         self.assertEqual(block['image']['external']['url'], 'https://example.com/image.png')
 
+    def test_repeated_lines_reuse_blocks(self):
+        body = "> Template callout\n```\n> Template callout\n```\n> Template callout"
+        first = self.parser._parse_body_to_blocks(body)
+        second = self.parser._parse_body_to_blocks("> Template callout")
+        # 代码块内的同一行不受缓存影响
+        self.assertEqual([block['type'] for block in first], ['quote', 'code', 'quote'])
+        self.assertIs(first[0], first[2])
+        self.assertIs(first[0], second[0])
+
+    def test_long_lines_not_cached(self):
+        long_line = "x" * 5000
+        blocks = self.parser._parse_body_to_blocks(long_line)
+        self.assertEqual(len(blocks[0]['paragraph']['rich_text'][0]['text']['content']), 2000)
+        self.assertNotIn(long_line, self.parser._block_cache)
+
 if __name__ == '__main__':
     unittest.main()
@@ -4,42 +4,62 @@ Tests for Sync Service.
 Author: wdblink
 """
 
+import os
+import time
 import unittest
 import json
+import sqlite3
 import tempfile
 import shutil
 from pathlib import Path
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
-from src.sync_service import SyncService
+from src.sync_service import SyncService, _VaultEventHandler, _hash_bytes
 from src.config import Config
 
+# 优先在内存文件系统 (tmpfs) 上创建临时目录，测试文件的创建、读取和清理都不落盘
+TEST_TMPDIR = os.environ.get("TEST_TMPDIR") or ("/dev/shm" if os.path.isdir("/dev/shm") else None)
+
 class TestSyncService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # 补丁在整个测试类中只安装一次，每个测试开始前重置
+        cls.mock_config_patcher = patch('src.sync_service.get_config')
+        cls.mock_get_config = cls.mock_config_patcher.start()
+        cls.mock_config = MagicMock()
+        cls.mock_get_config.return_value = cls.mock_config
+
+        cls.mock_notion_patcher = patch('src.sync_service.NotionAdapter')
+        cls.MockNotionAdapter = cls.mock_notion_patcher.start()
+        cls.mock_notion = cls.MockNotionAdapter.return_value
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.mock_config_patcher.stop()
+        cls.mock_notion_patcher.stop()
+
     def setUp(self):
-        # 创建临时目录作为 Obsidian Vault
-        self.test_dir = tempfile.mkdtemp()
+        # 创建临时目录作为 Obsidian Vault，同时作为工作目录，
+        # 使 SyncService 默认的状态库路径也落在临时目录中
+        self.test_dir = tempfile.mkdtemp(dir=TEST_TMPDIR)
         self.vault_path = Path(self.test_dir)
+        self.original_cwd = os.getcwd()
+        os.chdir(self.test_dir)
         
         # Mock Config
-        self.mock_config_patcher = patch('src.sync_service.get_config')
-        self.mock_get_config = self.mock_config_patcher.start()
-        self.mock_config = MagicMock()
         self.mock_config.OBSIDIAN_VAULT_PATH = self.vault_path
         self.mock_config.NOTION_TOKEN = "fake_token"
         self.mock_config.NOTION_DATABASE_ID = "fake_db_id"
-        self.mock_get_config.return_value = self.mock_config
+        self.mock_config.SYNC_MAX_WORKERS = 3
+        self.mock_config.HASH_ALGO = "md5"
 
-        # Mock NotionAdapter
-        self.mock_notion_patcher = patch('src.sync_service.NotionAdapter')
-        self.MockNotionAdapter = self.mock_notion_patcher.start()
-        self.mock_notion = self.MockNotionAdapter.return_value
+        # Mock NotionAdapter：清除上一个测试设置的返回值和调用记录
+        self.MockNotionAdapter.reset_mock()
+        self.mock_notion.reset_mock(return_value=True, side_effect=True)
 
     def tearDown(self):
+        os.chdir(self.original_cwd)
         shutil.rmtree(self.test_dir)
-        self.mock_config_patcher.stop()
-        self.mock_notion_patcher.stop()
-        # 清理生成的 state 文件
-        if Path("sync_state.json").exists():
-            Path("sync_state.json").unlink()
 
     def test_sync_new_file(self):
         # 创建测试文件
@@ -47,35 +67,152 @@ class TestSyncService(unittest.TestCase):
         with open(file_path, "w") as f:
             f.write("# Hello\nWorld")
 
-        # Mock create_page return value
-        self.mock_notion.create_page.return_value = {"id": "new_page_id"}
-        self.mock_notion.find_page_by_title.return_value = None
+        # Mock create_pages_batch return value
+        self.mock_notion.create_pages_batch.return_value = [{"id": "new_page_id"}]
+        self.mock_notion.list_all_pages.return_value = []
 
         service = SyncService()
         # 强制使用临时的 state 文件路径，避免影响当前目录（虽然 tearDown 会删，但最好隔离）
-        service.state_file = Path(self.test_dir) / "sync_state.json"
+        service.state_file = Path(self.test_dir) / "sync_state.db"
         
         service.sync()
 
-        # 验证 create_page 被调用
-        self.mock_notion.create_page.assert_called_once()
-        args, _ = self.mock_notion.create_page.call_args
+        # 验证新页面通过批量接口创建
+        self.mock_notion.create_pages_batch.assert_called_once()
+        args, _ = self.mock_notion.create_pages_batch.call_args
         self.assertEqual(args[0], "fake_db_id") # database_id
-        self.assertEqual(args[1]["Name"]["title"][0]["text"]["content"], "test") # title from filename
+        self.assertEqual(len(args[1]), 1)
+        self.assertEqual(args[1][0]["properties"]["Name"]["title"][0]["text"]["content"], "test") # title from filename
+
+        # 验证状态已写入状态库
+        conn = sqlite3.connect(service.state_file)
+        row = conn.execute("SELECT page_id FROM files WHERE path = 'test.md'").fetchone()
+        conn.close()
+        self.assertEqual(row, ("new_page_id",))
+
+    def test_sync_nested_files(self):
+        (self.vault_path / "sub" / "deeper").mkdir(parents=True)
+        for name in ("a.md", "sub/b.md", "sub/deeper/c.md", "sub/ignored.txt"):
+            with open(self.vault_path / name, "w") as f:
+                f.write("Content")
+
+        self.mock_notion.create_pages_batch.side_effect = lambda db_id, payloads: [{"id": "new_page_id"}] * len(payloads)
+        self.mock_notion.list_all_pages.return_value = []
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        service.sync()
+
+        # 三个新文件在同一批中创建
+        self.mock_notion.create_pages_batch.assert_called_once()
+        self.assertEqual(len(self.mock_notion.create_pages_batch.call_args[0][1]), 3)
+        self.assertEqual(
+            set(service.state),
+            {"a.md", str(Path("sub/b.md")), str(Path("sub/deeper/c.md"))}
+        )
+
+    def test_existing_pages_looked_up_once(self):
+        for name in ("a.md", "b.md"):
+            with open(self.vault_path / name, "w") as f:
+                f.write("Content")
+
+        self.mock_notion.list_all_pages.return_value = [{"id": "page_a", "title": "a"}]
+        self.mock_notion.create_pages_batch.return_value = [{"id": "page_b"}]
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        service.sync()
+
+        # 整个数据库只查询一次
+        self.mock_notion.list_all_pages.assert_called_once_with("fake_db_id")
+        self.mock_notion.update_page.assert_called_once()
+        self.assertEqual(self.mock_notion.update_page.call_args[0][0], "page_a")
+        self.mock_notion.create_pages_batch.assert_called_once()
+        self.assertEqual(service.state["b.md"]["page_id"], "page_b")
+
+    def test_same_page_updates_not_concurrent(self):
+        # 不同目录下的同名笔记都匹配到 Notion 中已有的同一个页面
+        for folder in ("a", "b"):
+            (self.vault_path / folder).mkdir()
+            with open(self.vault_path / folder / "note.md", "w") as f:
+                f.write(f"Content {folder}")
+        self.mock_notion.list_all_pages.return_value = [{"id": "page_p", "title": "note"}]
+
+        active = []
+        overlaps = []
+        def update_page(page_id, properties, children):
+            active.append(page_id)
+            overlaps.append(len(active))
+            time.sleep(0.05)
+            active.remove(page_id)
+            return True
+        self.mock_notion.update_page.side_effect = update_page
+
+        service = SyncService()
+        service.sync()
+
+        self.assertEqual(self.mock_notion.update_page.call_count, 2)
+        self.assertEqual(max(overlaps), 1)
+        self.mock_notion.create_pages_batch.assert_not_called()
+
+    def test_same_title_new_files_share_one_page(self):
+        for folder in ("a", "b"):
+            (self.vault_path / folder).mkdir()
+            with open(self.vault_path / folder / "note.md", "w") as f:
+                f.write(f"Content {folder}")
+        self.mock_notion.list_all_pages.return_value = []
+        self.mock_notion.create_pages_batch.side_effect = lambda db_id, payloads: [{"id": "page_p"}] * len(payloads)
+        self.mock_notion.update_page.return_value = True
+
+        service = SyncService()
+        service.sync()
+
+        # 与页面已存在时一致：只创建一个页面，另一个文件随后更新该页面
+        self.mock_notion.create_pages_batch.assert_called_once()
+        self.assertEqual(len(self.mock_notion.create_pages_batch.call_args[0][1]), 1)
+        self.mock_notion.update_page.assert_called_once()
+        self.assertEqual(self.mock_notion.update_page.call_args[0][0], "page_p")
+        self.assertEqual(
+            {entry["page_id"] for entry in service.state.values()}, {"page_p"}
+        )
+        self.assertEqual(len(service.state), 2)
+        self.assertEqual(service.title_index, {"note": "page_p"})
+
+    def test_same_title_new_files_in_later_batch(self):
+        # 每批一个文件：后一批通过标题索引找到前一批刚创建的页面
+        with patch('src.sync_service.SYNC_BATCH_SIZE', 1):
+            self.test_same_title_new_files_share_one_page()
+
+    def test_page_index_failure_not_retried(self):
+        for name in ("a.md", "b.md", "c.md"):
+            with open(self.vault_path / name, "w") as f:
+                f.write("Content")
+        self.mock_notion.list_all_pages.side_effect = RuntimeError("network down")
+
+        service = SyncService()
+        service.sync()
+
+        # 索引构建失败后不再为每个新文件重新扫描数据库，新文件留待下次同步
+        self.mock_notion.list_all_pages.assert_called_once()
+        self.mock_notion.create_pages_batch.assert_not_called()
+        self.assertEqual(service.state, {})
 
-        # 验证状态已更新
-        with open(service.state_file, "r") as f:
-            state = json.load(f)
-        self.assertIn("test.md", state)
-        self.assertEqual(state["test.md"]["page_id"], "new_page_id")
+        # 下一次同步重新尝试
+        self.mock_notion.list_all_pages.side_effect = None
+        self.mock_notion.list_all_pages.return_value = []
+        self.mock_notion.create_pages_batch.side_effect = lambda db_id, payloads: [{"id": "page_id"}] * len(payloads)
+        service.sync()
+        self.assertEqual(self.mock_notion.list_all_pages.call_count, 2)
+        self.assertEqual(len(service.state), 3)
 
     def test_sync_updated_file(self):
         # 1. 先模拟已同步状态
         service = SyncService()
-        service.state_file = Path(self.test_dir) / "sync_state.json"
+        service.state_file = Path(self.test_dir) / "sync_state.db"
         service.state = {
             "test.md": {
-                "mtime": 0,
+                "mtime_ns": 0,
+                "size": 0,
                 "hash": "old_hash",
                 "page_id": "existing_page_id"
             }
@@ -87,16 +224,107 @@ class TestSyncService(unittest.TestCase):
         with open(file_path, "w") as f:
             f.write("# Updated\nContent")
 
-        # 3. 执行同步
-        service.sync()
+        # 3. 执行同步；大小已变化，无需预先计算哈希即可判定为修改
+        with patch.object(service, "_calculate_file_hash", wraps=service._calculate_file_hash) as mock_hash:
+            service.sync()
+            mock_hash.assert_not_called()
 
         # 验证 update_page 被调用
         self.mock_notion.update_page.assert_called_once()
         args, _ = self.mock_notion.update_page.call_args
         self.assertEqual(args[0], "existing_page_id")
         
-        # 验证 create_page 未被调用
-        self.mock_notion.create_page.assert_not_called()
+        # 验证没有创建新页面
+        self.mock_notion.create_pages_batch.assert_not_called()
+
+    def test_legacy_json_state_migrated(self):
+        with open(Path(self.test_dir) / "sync_state.json", "w") as f:
+            json.dump({"test.md": {"mtime": 0, "hash": "old_hash", "page_id": "page_id"}}, f)
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        service.state = service._load_state()
+        self.assertEqual(service.state["test.md"]["page_id"], "page_id")
+
+        # 迁移来的条目在下次保存时写入状态库，旧版独有的字段被丢弃
+        service._save_state()
+        self.assertTrue(service.state_file.exists())
+        self.assertEqual(service._load_state(), {"test.md": {"hash": "old_hash", "page_id": "page_id"}})
+
+    def test_hash_algo_change_keeps_legacy_entries(self):
+        file_path = self.vault_path / "test.md"
+        with open(file_path, "w") as f:
+            f.write("Content")
+
+        # 旧状态没有 hash_algo，使用 MD5
+        self.mock_config.HASH_ALGO = "blake2b"
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        service.state = {
+            "test.md": {
+                "hash": service._calculate_file_hash(file_path, "md5"),
+                "page_id": "page_id"
+            }
+        }
+
+        service.sync()
+
+        # 内容未变，不应重新上传
+        self.mock_notion.update_page.assert_not_called()
+        self.mock_notion.create_pages_batch.assert_not_called()
+
+        # 内容变化后迁移到新算法
+        with open(file_path, "w") as f:
+            f.write("New content")
+        service.sync()
+
+        self.mock_notion.update_page.assert_called_once()
+        self.assertEqual(service.state["test.md"]["hash_algo"], "blake2b")
+        self.assertEqual(service.state["test.md"]["hash"], service._calculate_file_hash(file_path))
+
+    def test_properties_only_change_skips_content(self):
+        file_path = self.vault_path / "test.md"
+        with open(file_path, "w") as f:
+            f.write("---\ntags: [a]\n---\n# Body\n")
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        _, blocks = service.parser.parse_file(file_path)
+        service.state = {
+            "test.md": {
+                "hash": "old_hash",
+                "blocks_hash": service._calculate_blocks_hash(blocks),
+                "page_id": "existing_page_id"
+            }
+        }
+
+        # 只修改 Frontmatter，正文不变
+        with open(file_path, "w") as f:
+            f.write("---\ntags: [a, b]\n---\n# Body\n")
+
+        service.sync()
+
+        self.mock_notion.update_page.assert_called_once()
+        args, _ = self.mock_notion.update_page.call_args
+        self.assertEqual(args[0], "existing_page_id")
+        self.assertIsNone(args[2])
+
+    def test_large_file_hash(self):
+        file_path = self.vault_path / "large.md"
+        data = b"0123456789abcdef" * (128 * 1024)  # 2 MiB，跨越多个读取块
+        file_path.write_bytes(data)
+
+        service = SyncService()
+        for algo in ("md5", "blake2b"):
+            self.assertEqual(service._calculate_file_hash(file_path, algo), _hash_bytes(data, algo))
+            self.assertEqual(service._read_and_hash(file_path, algo), (data, _hash_bytes(data, algo)))
+
+    def test_blocks_hash_independent_of_orjson(self):
+        service = SyncService()
+        blocks = [{"type": "paragraph", "paragraph": {"rich_text": [{"text": {"content": "中文 \"quoted\""}}]}}]
+        with_orjson = service._calculate_blocks_hash(blocks)
+        with patch('src.sync_service.orjson', None):
+            self.assertEqual(service._calculate_blocks_hash(blocks), with_orjson)
 
     def test_skip_unchanged_file(self):
         file_path = self.vault_path / "test.md"
@@ -104,24 +332,178 @@ class TestSyncService(unittest.TestCase):
             f.write("Content")
             
         service = SyncService()
-        service.state_file = Path(self.test_dir) / "sync_state.json"
+        service.state_file = Path(self.test_dir) / "sync_state.db"
         
         # 手动计算 hash 并写入 state
         current_hash = service._calculate_file_hash(file_path)
+        st = file_path.stat()
         service.state = {
             "test.md": {
-                "mtime": file_path.stat().st_mtime,
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
                 "hash": current_hash,
                 "page_id": "page_id"
             }
         }
         service._save_state()
 
-        service.sync()
+        # stat 未变时不应读取文件
+        with patch.object(service, "_read_and_hash", wraps=service._read_and_hash) as mock_read:
+            service.sync()
+            mock_read.assert_not_called()
 
         # 验证没有任何 API 调用
-        self.mock_notion.create_page.assert_not_called()
+        self.mock_notion.create_pages_batch.assert_not_called()
+        self.mock_notion.update_page.assert_not_called()
+
+    def test_state_saved_when_sync_fails(self):
+        for name in ("a.md", "b.md"):
+            with open(self.vault_path / name, "w") as f:
+                f.write("Content")
+        self.mock_notion.list_all_pages.return_value = []
+        self.mock_notion.create_pages_batch.side_effect = RuntimeError("boom")
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        # a.md 只是被 touch，b.md 是新文件，创建页面时出错
+        service.state = {
+            "a.md": {
+                "mtime_ns": 0,
+                "size": (self.vault_path / "a.md").stat().st_size,
+                "hash": service._calculate_file_hash(self.vault_path / "a.md"),
+                "page_id": "page_a"
+            }
+        }
+
+        with self.assertRaises(RuntimeError):
+            service.sync()
+
+        # 出错前已完成的部分仍然写入状态库
+        saved = service._load_state()
+        self.assertEqual(saved["a.md"]["mtime_ns"], (self.vault_path / "a.md").stat().st_mtime_ns)
+        self.assertNotIn("b.md", saved)
+
+    def test_skip_unchanged_vault(self):
+        (self.vault_path / "sub").mkdir()
+        for name in ("a.md", "sub/b.md"):
+            with open(self.vault_path / name, "w") as f:
+                f.write("Content")
+
+        self.mock_notion.create_pages_batch.side_effect = lambda db_id, payloads: [{"id": "page_id"}] * len(payloads)
+        self.mock_notion.list_all_pages.return_value = []
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        service.sync()
+
+        # 没有任何变化时，再次同步不计算哈希也不读取文件
+        with patch.object(service, "_calculate_file_hash", wraps=service._calculate_file_hash) as mock_hash, \
+                patch.object(service, "_read_and_hash", wraps=service._read_and_hash) as mock_read:
+            service.sync()
+            mock_hash.assert_not_called()
+            mock_read.assert_not_called()
+        self.mock_notion.update_page.assert_not_called()
+        self.mock_notion.create_pages_batch.assert_called_once()
+
+    def test_touched_file_refreshes_stat(self):
+        file_path = self.vault_path / "test.md"
+        with open(file_path, "w") as f:
+            f.write("Content")
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        # touch 只改变修改时间，大小不变
+        service.state = {
+            "test.md": {
+                "mtime_ns": 0,
+                "size": file_path.stat().st_size,
+                "hash": service._calculate_file_hash(file_path),
+                "page_id": "page_id"
+            }
+        }
+
+        # 大小相同时流式计算哈希确认，不把文件读入内存
+        with patch.object(service, "_read_and_hash", wraps=service._read_and_hash) as mock_read:
+            service.sync()
+            mock_read.assert_not_called()
+
+        # 内容未变，只刷新 stat 信息
+        self.mock_notion.update_page.assert_not_called()
+        st = file_path.stat()
+        self.assertEqual(service.state["test.md"]["mtime_ns"], st.st_mtime_ns)
+        self.assertEqual(service.state["test.md"]["size"], st.st_size)
+
+        # 再次同步时走 stat 快速路径，不再读取文件，也不重写状态文件
+        service.state_file.unlink()
+        with patch.object(service, "_read_and_hash", wraps=service._read_and_hash) as mock_read:
+            service.sync()
+            mock_read.assert_not_called()
+        self.assertFalse(service.state_file.exists())
+
+    def test_many_touched_files_all_hashed(self):
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        for i in range(50):
+            file_path = self.vault_path / f"note{i}.md"
+            with open(file_path, "w") as f:
+                f.write(f"Content {i}")
+            service.state[file_path.name] = {
+                "mtime_ns": 0,
+                "size": file_path.stat().st_size,
+                "hash": service._calculate_file_hash(file_path),
+                "page_id": f"page_{i}"
+            }
+
+        with patch.object(service, "_calculate_file_hash", wraps=service._calculate_file_hash) as mock_hash:
+            service.sync()
+
+        # 每个文件都计算一次哈希，内容未变，不发起任何更新
+        self.assertEqual(mock_hash.call_count, 50)
+        self.assertEqual(
+            {call.args[0].name for call in mock_hash.call_args_list},
+            {f"note{i}.md" for i in range(50)}
+        )
         self.mock_notion.update_page.assert_not_called()
+        self.mock_notion.create_pages_batch.assert_not_called()
+
+    def test_sync_watch_updated_file(self):
+        for name in ("a.md", "b.md"):
+            with open(self.vault_path / name, "w") as f:
+                f.write("Content")
+
+        service = SyncService()
+        service.state_file = Path(self.test_dir) / "sync_state.db"
+        service.state = {
+            name: {"mtime_ns": 0, "size": 0, "hash": "old_hash", "page_id": f"page_{name}"}
+            for name in ("a.md", "b.md")
+        }
+
+        # 模拟监听到的事件：只有 a.md 被修改，非 Markdown 文件被忽略
+        service.enqueue(str(self.vault_path / "a.md"))
+        service.enqueue(str(self.vault_path / "notes.txt"))
+        with patch.object(service, "_iter_markdown_files") as mock_walk:
+            service.sync_pending()
+            mock_walk.assert_not_called()
+
+        self.mock_notion.update_page.assert_called_once()
+        self.assertEqual(self.mock_notion.update_page.call_args[0][0], "page_a.md")
+        self.assertEqual(service._pending_paths, set())
+
+    def test_watch_event_handler(self):
+        service = SyncService()
+        handler = _VaultEventHandler(service)
+        vault = str(self.vault_path)
+
+        handler.on_modified(SimpleNamespace(is_directory=False, src_path=os.path.join(vault, "a.md")))
+        handler.on_created(SimpleNamespace(is_directory=False, src_path=os.fsencode(os.path.join(vault, "b.md"))))
+        handler.on_moved(SimpleNamespace(
+            is_directory=False, src_path=os.path.join(vault, "old.md"), dest_path=os.path.join(vault, "new.md")
+        ))
+        # 目录事件和仓库外的文件被忽略
+        handler.on_modified(SimpleNamespace(is_directory=True, src_path=os.path.join(vault, "sub.md")))
+        handler.on_modified(SimpleNamespace(is_directory=False, src_path=os.path.join(os.path.dirname(vault), "x.md")))
+
+        self.assertEqual(service._pending_paths, {"a.md", "b.md", "new.md"})
 
 if __name__ == '__main__':
     unittest.main()